@@ -11,7 +11,8 @@ class GraphBackend(object):
         """ Create a new graph
 
         :param set hubs: predefined hubs
-        :param dict links: nodes connection: node -> set([node, ...])
+        :param dict links: nodes connection: node -> set([node, ...]).
+        A node that is not a hub may be mapped to its only hub directly.
         """
         self.__hubs = hubs or set()
         self.__links = links or {}
@@ -21,7 +22,10 @@ class GraphBackend(object):
             if hub in self.__hubs:
                 raise Exception("Hub '{}' already exists".format(hub))
             self.__hubs.add(hub)
-            self.__links.setdefault(hub, set())
+            if hub not in self.__links:
+                self.__links[hub] = set()
+            elif not isinstance(self.__links[hub], set):
+                self.__links[hub] = set([self.__links[hub]])
         return self
 
     def remove_hub(self, hub):
@@ -49,7 +53,7 @@ class GraphBackend(object):
             raise Exception(error_message.format(hub, node))
         nodes.add(node)
         if not self.is_hub(node):
-            self._links(node).add(hub)
+            self._add_node_hub(node, hub)
         return self
 
     def unlink(self, hub, node):
@@ -60,20 +64,44 @@ class GraphBackend(object):
             error_message = "Hub '{}' is not connected to node '{}'"
             raise Exception(error_message.format(hub, node))
         if not self.is_hub(node):
-            node_hubs = self._links(node)
-            node_hubs.remove(hub)
-            if len(node_hubs) == 0:
-                self.__links.pop(node)
+            self._remove_node_hub(node, hub)
         nodes.remove(node)
         return self
 
-    def _links(self, node):
-        return self.__links.setdefault(node, set())
+    def _links(self, hub):
+        return self.__links.setdefault(hub, set())
+
+    def _add_node_hub(self, node, hub):
+        """ Store the only hub of a node inline, and upgrade it
+        to a set when a second hub is linked.
+        """
+        if node not in self.__links:
+            self.__links[node] = hub
+            return
+        hubs = self.__links[node]
+        if isinstance(hubs, set):
+            hubs.add(hub)
+        else:
+            self.__links[node] = set([hubs, hub])
+
+    def _remove_node_hub(self, node, hub):
+        hubs = self.__links[node]
+        if not isinstance(hubs, set):
+            self.__links.pop(node)
+            return
+        hubs.remove(hub)
+        if len(hubs) == 0:
+            self.__links.pop(node)
+        elif len(hubs) == 1:
+            self.__links[node] = hubs.pop()
 
     def links(self, node):
         if node not in self.__links:
             raise Exception("Unknown node '{}'".format(node))
-        return copy.deepcopy(self._links(node))
+        links = self.__links[node]
+        if not isinstance(links, set):
+            return set([links])
+        return copy.deepcopy(links)
 
     def hub_links(self, hub):
         if not self.is_hub(hub):
@@ -97,20 +125,120 @@ class TopologyBackend(object):
         self.nodes = nodes or {}
         self.hubs = hubs or {}
 
+    def apply(self, moves, max_nodes_per_hub):
+        """ Replay topology moves. The whole sequence is validated
+        before the topology is modified.
+
+        Moves are consumed in a single pass, so they can be streamed from
+        `iter_diff`. Only the final assignment of every moved node and the
+        load of every affected hub are kept in memory.
+
+        :param moves: `TopologyChange`, or iterable of
+        `('assign', hub, node)` and `('unassign', hub, node)` tuples
+        :param int max_nodes_per_hub: hubs capacity, `HubDispatch`
+        topologies should use the dispatcher's limit.
+        """
+        moved = {}
+        loads = {}
+        for action, hub, node in moves:
+            current_hub = moved[node] if node in moved \
+                else self.nodes.get(node)
+            if action == 'unassign':
+                if current_hub != hub:
+                    error_message = "Node '{}' is not assigned to hub '{}'"
+                    raise Exception(error_message.format(node, hub))
+                moved[node] = None
+                loads[hub] = loads.get(hub, self.hubs.get(hub, 0)) - 1
+            elif action == 'assign':
+                if current_hub is not None:
+                    error_message = "Node '{}' is already assigned"
+                    raise Exception(error_message.format(node))
+                moved[node] = hub
+                loads[hub] = loads.get(hub, self.hubs.get(hub, 0)) + 1
+            else:
+                raise Exception("Unknown move '{}'".format(action))
+        for hub, load in loads.iteritems():
+            if load > max_nodes_per_hub:
+                error_message = "Hub '{}' can't be assigned {} nodes"
+                raise Exception(error_message.format(hub, load))
+        for node, hub in moved.iteritems():
+            if hub is None:
+                self.nodes.pop(node, None)
+            else:
+                self.nodes[node] = hub
+        for hub, load in loads.iteritems():
+            if load > 0:
+                self.hubs[hub] = load
+            else:
+                self.hubs.pop(hub, None)
+        return self
+
 
 class TopologyChange(object):
+    """ Ordered log of topology moves
+    """
     def __init__(self, **kwargs):
         self._clear()
 
     def _clear(self):
-        self.assignments = []
-        self.unassignments = []
+        self.moves = []
+
+    def __iter__(self):
+        return iter(self.moves)
+
+    @property
+    def assignments(self):
+        return [
+            (hub, node) for action, hub, node in self.moves
+            if action == 'assign'
+        ]
+
+    @property
+    def unassignments(self):
+        return [
+            (hub, node) for action, hub, node in self.moves
+            if action == 'unassign'
+        ]
 
     def assign(self, hub, node):
-        self.assignments.append((hub, node))
+        self.moves.append(('assign', hub, node))
 
     def unassign(self, hub, node):
-        self.unassignments.append((hub, node))
+        self.moves.append(('unassign', hub, node))
+
+
+def iter_diff(topology_a, topology_b):
+    """ Lazily compute the moves that turn one topology into another,
+    without copying the assignments of either topology.
+
+    :return: generator of `('unassign', hub, node)` and
+    `('assign', hub, node)` tuples. Unassignments of a node are always
+    yielded before its assignment.
+    """
+    nodes_b = topology_b.nodes
+    for node, hub_a in topology_a.nodes.iteritems():
+        hub_b = nodes_b.get(node)
+        if hub_b != hub_a:
+            yield ('unassign', hub_a, node)
+            if hub_b is not None:
+                yield ('assign', hub_b, node)
+    nodes_a = topology_a.nodes
+    for node, hub_b in nodes_b.iteritems():
+        if node not in nodes_a:
+            yield ('assign', hub_b, node)
+
+
+def diff(topology_a, topology_b):
+    """ Compute the minimal change that turns one topology into another
+
+    :param TopologyBackend topology_a: current topology
+    :param TopologyBackend topology_b: target topology
+    :rtype: TopologyChange
+    """
+    change = TopologyChange()
+    for action, hub, node in iter_diff(topology_a, topology_b):
+        getattr(change, action)(hub, node)
+    return change
 
 
 class HubDispatch(object):
@@ -170,6 +298,15 @@ class HubDispatch(object):
         self._graph.unlink(hub, node)
         return self
 
+    def pop_changes(self):
+        """ Get and reset the topology changes recorded so far
+
+        :return: `(assignments, unassignments)` lists of `(hub, node)`
+        """
+        changes = (self._changes.assignments, self._changes.unassignments)
+        self._changes._clear()
+        return changes
+
     def _decr_hub(self, hub):
         assignee = self._topology.hubs[hub]
         assert assignee > 0, "should not have less than 1 assignee"
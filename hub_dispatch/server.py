@@ -0,0 +1,411 @@
+""" Local dispatch service around `HubDispatch`
+
+Clients talk to the service over a Unix or TCP socket with a simple framed
+protocol: every frame is a 4-bytes big-endian length followed by a JSON
+document of that length.
+
+A request is `{"id": 1, "op": "link", "args": ["hub", "node"]}` where `op`
+is one of `add_hub`, `remove_hub`, `link`, `unlink` or `subscribe`. The
+server answers with `{"id": 1, "error": null}`, or the error message when
+the operation failed. Malformed requests are answered with an error whose
+`id` is null. Frames larger than `MAX_FRAME_SIZE` close the connection.
+
+After a `subscribe` request, the connection receives a stream of
+`{"assignments": [...], "unassignments": [...]}` frames, one per batch of
+mutations that modified the topology. A subscriber that falls more than
+`max_pending_changes` notifications behind is disconnected.
+
+A single writer thread owns the dispatcher: connection handlers enqueue
+their requests, and the writer coalesces every pending request into one
+batch, so that many producers can feed the same dispatcher without locking.
+"""
+import argparse
+import errno
+import json
+import logging
+import os
+import Queue
+import select
+import socket
+import SocketServer
+import stat
+import struct
+import threading
+
+from . import HubDispatch
+
+HEADER = struct.Struct('>I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+MUTATIONS = frozenset(['add_hub', 'remove_hub', 'link', 'unlink'])
+LOGGER = logging.getLogger(__name__)
+
+
+class FrameTooLarge(Exception):
+    pass
+
+
+def send_frame(sock, payload):
+    data = json.dumps(payload)
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def recv_frame(sock, max_size=MAX_FRAME_SIZE):
+    """ Read the next frame from a socket
+
+    :return: decoded payload, or `None` if the peer closed the connection
+    :raises FrameTooLarge: if the frame length exceeds `max_size`
+    :raises ValueError: if the payload is not valid JSON
+    """
+    header = _recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    size = HEADER.unpack(header)[0]
+    if size > max_size:
+        error_message = 'Frame of {} bytes exceeds the {} bytes limit'
+        raise FrameTooLarge(error_message.format(size, max_size))
+    data = _recv_exactly(sock, size)
+    if data is None:
+        return None
+    return json.loads(data)
+
+
+def _readable(sock):
+    """ Tell whether reading from a socket would not block. `poll` is
+    preferred because `select` can't watch descriptors above FD_SETSIZE.
+    """
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        poller.register(sock, select.POLLIN)
+        return any(poller.poll(0))
+    return any(select.select([sock], [], [], 0)[0])
+
+
+class DispatchWriter(threading.Thread):
+    """ Thread that owns the dispatcher and applies requests by batch
+    """
+    def __init__(self, dispatch, max_batch_size=1000,
+                 max_pending_changes=1000):
+        super(DispatchWriter, self).__init__(name='hub-dispatch-writer')
+        self.daemon = True
+        self._dispatch = dispatch
+        self._max_batch_size = max_batch_size
+        self._max_pending_changes = max_pending_changes
+        self._requests = Queue.Queue()
+        self._subscribers = set()
+        self._subscribers_lock = threading.Lock()
+
+    def submit(self, op, args):
+        """ Enqueue a mutation and wait for its completion
+
+        :return: error message, or `None` on success
+        """
+        reply = Queue.Queue(maxsize=1)
+        self._requests.put((op, args, reply))
+        return reply.get()
+
+    def subscribe(self):
+        """ :return: queue receiving topology changes of every batch.
+        The subscription is dropped when the queue is full.
+        """
+        changes = Queue.Queue(maxsize=self._max_pending_changes)
+        with self._subscribers_lock:
+            self._subscribers.add(changes)
+        return changes
+
+    def unsubscribe(self, changes):
+        with self._subscribers_lock:
+            self._subscribers.discard(changes)
+
+    def is_subscribed(self, changes):
+        with self._subscribers_lock:
+            return changes in self._subscribers
+
+    def stop(self):
+        self._requests.put(None)
+
+    def run(self):
+        while True:
+            batch = [self._requests.get()]
+            while len(batch) < self._max_batch_size:
+                try:
+                    batch.append(self._requests.get_nowait())
+                except Queue.Empty:
+                    break
+            stop = None in batch
+            self._apply([request for request in batch if request is not None])
+            if stop:
+                return
+
+    def _apply(self, batch):
+        replies = []
+        for op, args, reply in batch:
+            try:
+                getattr(self._dispatch, op)(*args)
+            except Exception as exc:
+                replies.append((reply, str(exc) or exc.__class__.__name__))
+            else:
+                replies.append((reply, None))
+        try:
+            self._publish()
+        except Exception:
+            LOGGER.exception('Could not publish topology changes')
+        finally:
+            for reply, error in replies:
+                reply.put(error)
+
+    def _publish(self):
+        assignments, unassignments = self._dispatch.pop_changes()
+        if not assignments and not unassignments:
+            return
+        notification = {
+            'assignments': assignments,
+            'unassignments': unassignments,
+        }
+        with self._subscribers_lock:
+            overflowed = []
+            for subscriber in self._subscribers:
+                try:
+                    subscriber.put_nowait(notification)
+                except Queue.Full:
+                    overflowed.append(subscriber)
+            self._subscribers.difference_update(overflowed)
+
+
+class DispatchRequestHandler(SocketServer.BaseRequestHandler):
+    # delay between two checks of a subscriber connection
+    poll_interval = 0.2
+
+    def handle(self):
+        try:
+            self._serve_requests()
+        except socket.error:
+            # client disconnected before reading its answer
+            pass
+
+    def _serve_requests(self):
+        writer = self.server.writer
+        while True:
+            try:
+                request = recv_frame(self.request)
+            except FrameTooLarge as exc:
+                # the payload is left unread, the stream can't be resumed
+                send_frame(self.request, {'id': None, 'error': str(exc)})
+                return
+            except ValueError:
+                error = 'Request is not valid JSON'
+                send_frame(self.request, {'id': None, 'error': error})
+                continue
+            if request is None:
+                return
+            if not isinstance(request, dict):
+                error = 'Request must be a JSON object'
+                send_frame(self.request, {'id': None, 'error': error})
+                continue
+            op = request.get('op')
+            args = request.get('args', [])
+            if op == 'subscribe':
+                self._stream_changes(request)
+                return
+            if not isinstance(op, basestring) or op not in MUTATIONS:
+                error = "Unknown operation '{}'".format(op)
+            elif not isinstance(args, list):
+                error = 'Request arguments must be a JSON list'
+            else:
+                error = writer.submit(op, args)
+            send_frame(self.request, {'id': request.get('id'), 'error': error})
+
+    def _stream_changes(self, request):
+        writer = self.server.writer
+        changes = writer.subscribe()
+        try:
+            send_frame(self.request, {'id': request.get('id'), 'error': None})
+            while writer.is_subscribed(changes):
+                # subscribers are not expected to send anything: the socket
+                # becomes readable when the peer closes the connection.
+                if _readable(self.request):
+                    return
+                try:
+                    notification = changes.get(timeout=self.poll_interval)
+                except Queue.Empty:
+                    continue
+                send_frame(self.request, notification)
+        except socket.error:
+            pass
+        finally:
+            writer.unsubscribe(changes)
+
+
+class _DispatchServerMixin(SocketServer.ThreadingMixIn):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, dispatch=None, max_batch_size=1000,
+                 max_pending_changes=1000):
+        self.writer = DispatchWriter(
+            dispatch or HubDispatch(), max_batch_size, max_pending_changes
+        )
+        self._server_cls.__init__(self, address, DispatchRequestHandler)
+        self.writer.start()
+
+    def server_close(self):
+        self._server_cls.server_close(self)
+        # also called by the base constructor when binding fails
+        if self.writer.is_alive():
+            self.writer.stop()
+            self.writer.join()
+
+
+class TCPDispatchServer(_DispatchServerMixin, SocketServer.TCPServer):
+    _server_cls = SocketServer.TCPServer
+
+
+class UnixDispatchServer(_DispatchServerMixin, SocketServer.UnixStreamServer):
+    _server_cls = SocketServer.UnixStreamServer
+    _bound = False
+
+    def server_bind(self):
+        self._remove_stale_socket()
+        self._server_cls.server_bind(self)
+        self._bound = True
+
+    def _remove_stale_socket(self):
+        """ Remove the socket file left by a server that is not running
+        anymore, so that it can be restarted on the same path.
+        """
+        path = self.server_address
+        try:
+            mode = os.stat(path).st_mode
+        except OSError as exc:
+            if exc.errno == errno.ENOENT:
+                return
+            raise
+        if not stat.S_ISSOCK(mode):
+            raise Exception("'{}' exists and is not a socket".format(path))
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except socket.error as exc:
+            if exc.errno != errno.ECONNREFUSED:
+                raise
+            os.unlink(path)
+        else:
+            raise Exception("Socket '{}' is already in use".format(path))
+        finally:
+            probe.close()
+
+    def server_close(self):
+        _DispatchServerMixin.server_close(self)
+        if self._bound:
+            self._bound = False
+            try:
+                os.unlink(self.server_address)
+            except OSError as exc:
+                if exc.errno != errno.ENOENT:
+                    raise
+
+
+class DispatchClient(object):
+    """ Synchronous client of a dispatch server
+    """
+    def __init__(self, address):
+        """
+        :param address: `(host, port)` tuple of a TCP server,
+        or path to the socket of a Unix server.
+        """
+        if isinstance(address, basestring):
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.connect(address)
+        self._next_id = 0
+
+    def close(self):
+        self._sock.close()
+
+    def _call(self, op, *args):
+        self._next_id += 1
+        send_frame(self._sock, {'id': self._next_id, 'op': op, 'args': args})
+        response = recv_frame(self._sock)
+        if response is None:
+            raise Exception('Connection closed by server')
+        if response['error'] is not None:
+            raise Exception(response['error'])
+        return self
+
+    def add_hub(self, *hubs):
+        return self._call('add_hub', *hubs)
+
+    def remove_hub(self, hub):
+        return self._call('remove_hub', hub)
+
+    def link(self, hub, *nodes):
+        return self._call('link', hub, *nodes)
+
+    def unlink(self, hub, node):
+        return self._call('unlink', hub, node)
+
+    def changes(self):
+        """ Subscribe to topology changes. The connection can't be used
+        to submit mutations afterward.
+
+        :return: generator of `(assignments, unassignments)` tuples
+        """
+        self._call('subscribe')
+        return self._changes()
+
+    def _changes(self):
+        while True:
+            notification = recv_frame(self._sock)
+            if notification is None:
+                return
+            yield (
+                [tuple(change) for change in notification['assignments']],
+                [tuple(change) for change in notification['unassignments']],
+            )
+
+
+def create_server(argv=None):
+    """ Create a dispatch server from command line arguments
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--unix', metavar='PATH', help='Unix socket path')
+    group.add_argument('--port', type=int, help='TCP port')
+    parser.add_argument('--host', default='127.0.0.1', help='TCP address')
+    parser.add_argument('--max-nodes-per-hub', type=int, default=100)
+    parser.add_argument('--max-batch-size', type=int, default=1000)
+    parser.add_argument('--max-pending-changes', type=int, default=1000)
+    args = parser.parse_args(argv)
+    dispatch = HubDispatch(max_nodes_per_hub=args.max_nodes_per_hub)
+    server_args = (dispatch, args.max_batch_size, args.max_pending_changes)
+    if args.unix:
+        server = UnixDispatchServer(args.unix, *server_args)
+    else:
+        server = TCPDispatchServer((args.host, args.port), *server_args)
+    return server
+
+
+def main(argv=None):
+    logging.basicConfig()
+    server = create_server(argv)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
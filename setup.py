@@ -35,6 +35,11 @@ setup(
         'Natural Language :: English',
     ],
     packages=find_packages(exclude=['*.tests']),
+    entry_points={
+        'console_scripts': [
+            'hub-dispatch-server = hub_dispatch.server:main',
+        ],
+    },
     test_suite='docido.sdk.test.suite',
     zip_safe=True,
 )
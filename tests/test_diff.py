@@ -0,0 +1,129 @@
+import unittest
+
+from hub_dispatch import (
+    diff,
+    HubDispatch,
+    iter_diff,
+    TopologyBackend,
+    TopologyChange,
+)
+
+
+class TestDiff(unittest.TestCase):
+    def test_same_topology(self):
+        t = TopologyBackend(nodes={'h1': 'h1', 'n1': 'h1'}, hubs={'h1': 2})
+        change = diff(t, t)
+        self.assertEqual(change.assignments, [])
+        self.assertEqual(change.unassignments, [])
+
+    def test_diff(self):
+        a = TopologyBackend(nodes={
+            'h1': 'h1', 'h2': 'h2', 'n1': 'h1', 'n2': 'h1', 'n3': 'h2',
+        })
+        b = TopologyBackend(nodes={
+            'h1': 'h1', 'h2': 'h2', 'n1': 'h1', 'n2': 'h2', 'n4': 'h1',
+        })
+        change = diff(a, b)
+        self.assertEqual(
+            sorted(change.unassignments),
+            [('h1', 'n2'), ('h2', 'n3')]
+        )
+        self.assertEqual(
+            sorted(change.assignments),
+            [('h1', 'n4'), ('h2', 'n2')]
+        )
+
+    def test_iter_diff(self):
+        a = TopologyBackend(nodes={'n1': 'h1'})
+        b = TopologyBackend(nodes={'n1': 'h2'})
+        self.assertEqual(list(iter_diff(a, b)), [
+            ('unassign', 'h1', 'n1'),
+            ('assign', 'h2', 'n1'),
+        ])
+        self.assertEqual(list(iter_diff(a, TopologyBackend())), [
+            ('unassign', 'h1', 'n1'),
+        ])
+        self.assertEqual(list(iter_diff(TopologyBackend(), b)), [
+            ('assign', 'h2', 'n1'),
+        ])
+
+
+class TestApply(unittest.TestCase):
+    def test_apply_diff(self):
+        a = TopologyBackend(
+            nodes={'h1': 'h1', 'h2': 'h2', 'n1': 'h1', 'n2': 'h1'},
+            hubs={'h1': 3, 'h2': 1},
+        )
+        b = TopologyBackend(
+            nodes={'h2': 'h2', 'n1': 'h2', 'n3': 'h2'},
+            hubs={'h2': 3},
+        )
+        a.apply(diff(a, b), max_nodes_per_hub=3)
+        self.assertEqual(a.nodes, b.nodes)
+        self.assertEqual(a.hubs, b.hubs)
+
+    def test_apply_streamed_diff(self):
+        a = TopologyBackend(nodes={'h1': 'h1', 'n1': 'h1'}, hubs={'h1': 2})
+        b = TopologyBackend(
+            nodes={'h1': 'h1', 'h2': 'h2', 'n1': 'h2', 'n2': 'h2'},
+            hubs={'h1': 1, 'h2': 3},
+        )
+        a.apply(iter_diff(a, b), max_nodes_per_hub=3)
+        self.assertEqual(a.nodes, b.nodes)
+        self.assertEqual(a.hubs, b.hubs)
+
+    def test_apply_exceeding_capacity(self):
+        t = TopologyBackend(nodes={'h1': 'h1', 'n1': 'h1'}, hubs={'h1': 2})
+        change = TopologyChange()
+        change.assign('h1', 'n2')
+        with self.assertRaises(Exception) as exc:
+            t.apply(change, max_nodes_per_hub=2)
+        self.assertEqual(
+            exc.exception.message,
+            "Hub 'h1' can't be assigned 3 nodes"
+        )
+        # nothing must have been commited
+        self.assertEqual(t.nodes, {'h1': 'h1', 'n1': 'h1'})
+        self.assertEqual(t.hubs, {'h1': 2})
+        t.apply(change, max_nodes_per_hub=3)
+        self.assertEqual(t.hubs, {'h1': 3})
+
+    def test_apply_invalid_change(self):
+        t = TopologyBackend(nodes={'n1': 'h1'}, hubs={'h1': 1})
+        change = TopologyChange()
+        change.unassign('h2', 'n1')
+        with self.assertRaises(Exception) as exc:
+            t.apply(change, max_nodes_per_hub=2)
+        self.assertEqual(
+            exc.exception.message,
+            "Node 'n1' is not assigned to hub 'h2'"
+        )
+        change = TopologyChange()
+        change.assign('h2', 'n1')
+        with self.assertRaises(Exception) as exc:
+            t.apply(change, max_nodes_per_hub=2)
+        self.assertEqual(
+            exc.exception.message,
+            "Node 'n1' is already assigned"
+        )
+        self.assertEqual(t.nodes, {'n1': 'h1'})
+        self.assertEqual(t.hubs, {'h1': 1})
+
+    def test_apply_unknown_move(self):
+        t = TopologyBackend()
+        with self.assertRaises(Exception) as exc:
+            t.apply([('move', 'h1', 'n1')], max_nodes_per_hub=1)
+        self.assertEqual(exc.exception.message, "Unknown move 'move'")
+
+    def test_apply_dispatch_log(self):
+        h = HubDispatch(max_nodes_per_hub=3)\
+            .add_hub('h1', 'h2')\
+            .link('h1', 'n1', 'n2').link('h2', 'n1')\
+            .unlink('h1', 'n1').unlink('h1', 'n2')
+        t = TopologyBackend().apply(h._changes, max_nodes_per_hub=3)
+        self.assertEqual(t.nodes, h._topology.nodes)
+        self.assertEqual(t.hubs, h._topology.hubs)
+
+
+if __name__ == '__main__':
+    unittest.main()
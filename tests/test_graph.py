@@ -201,6 +201,29 @@ class TestGraph(unittest.TestCase):
         self.assertEqual(g.links('h2'), set(['node']))
         self.assertEqual(g.links('node'), set(['h2']))
 
+    def test_node_links_representation(self):
+        g = GraphBackend().add_hub('h1', 'h2', 'h3').link('h1', 'node')
+        links = g._GraphBackend__links
+        self.assertEqual(links['node'], 'h1')
+        g.link('h2', 'node').link('h3', 'node')
+        self.assertEqual(links['node'], set(['h1', 'h2', 'h3']))
+        self.assertEqual(g.links('node'), set(['h1', 'h2', 'h3']))
+        g.unlink('h1', 'node')
+        self.assertEqual(links['node'], set(['h2', 'h3']))
+        g.unlink('h3', 'node')
+        self.assertEqual(links['node'], 'h2')
+        self.assertEqual(g.links('node'), set(['h2']))
+        g.unlink('h2', 'node')
+        self.assertFalse('node' in links)
+
+    def test_promote_linked_node_to_hub(self):
+        g = GraphBackend().add_hub('h1').link('h1', 'node')
+        g.add_hub('node')
+        self.assertEqual(g.links('node'), set(['h1']))
+        g.link('node', 'other')
+        self.assertEqual(g.hub_links('node'), set(['h1', 'other']))
+        self.assertEqual(g.links('other'), set(['node']))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,281 @@
+import os.path
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from hub_dispatch import HubDispatch
+from hub_dispatch.server import (
+    create_server,
+    DispatchClient,
+    DispatchWriter,
+    HEADER,
+    MAX_FRAME_SIZE,
+    recv_frame,
+    send_frame,
+    TCPDispatchServer,
+    UnixDispatchServer,
+)
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.dispatch = HubDispatch()
+        self.server = TCPDispatchServer(('127.0.0.1', 0), self.dispatch)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.client = DispatchClient(self.server.server_address)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_mutations(self):
+        self.client.add_hub('h1', 'h2').link('h1', 'n1').link('h2', 'n1')
+        self.assertEqual(self.dispatch._topology.nodes, {
+            'h1': 'h1', 'h2': 'h2', 'n1': 'h1'
+        })
+        self.client.unlink('h1', 'n1')
+        self.assertEqual(self.dispatch._topology.nodes, {
+            'h1': 'h1', 'h2': 'h2', 'n1': 'h2'
+        })
+
+    def test_errors(self):
+        with self.assertRaises(Exception) as exc:
+            self.client.link('foo', 'bar')
+        self.assertEqual(exc.exception.message, "Hub 'foo' does not exist")
+        with self.assertRaises(Exception) as exc:
+            self.client._call('kruskal')
+        self.assertEqual(
+            exc.exception.message,
+            "Unknown operation 'kruskal'"
+        )
+        # connection is still usable
+        self.client.add_hub('foo')
+        self.assertEqual(self.dispatch._topology.nodes, {'foo': 'foo'})
+
+    def test_invalid_requests(self):
+        sock = socket.create_connection(self.server.server_address)
+
+        def assert_error(data, error, request_id=None):
+            sock.sendall(HEADER.pack(len(data)) + data)
+            self.assertEqual(
+                recv_frame(sock),
+                {'id': request_id, 'error': error}
+            )
+        assert_error('{"op": ', 'Request is not valid JSON')
+        assert_error('[1, 2]', 'Request must be a JSON object')
+        assert_error(
+            '{"id": 1, "op": ["link"]}',
+            "Unknown operation '[u'link']'",
+            request_id=1
+        )
+        assert_error(
+            '{"id": 2, "op": "add_hub", "args": "hub"}',
+            'Request arguments must be a JSON list',
+            request_id=2
+        )
+        self.assertEqual(self.dispatch._topology.nodes, {})
+        # connection is still usable
+        send_frame(sock, {'id': 3, 'op': 'add_hub', 'args': ['hub']})
+        self.assertEqual(recv_frame(sock), {'id': 3, 'error': None})
+        sock.close()
+
+    def test_frame_too_large(self):
+        sock = socket.create_connection(self.server.server_address)
+        sock.sendall(HEADER.pack(MAX_FRAME_SIZE + 1))
+        self.assertEqual(recv_frame(sock), {
+            'id': None,
+            'error': 'Frame of {} bytes exceeds the {} bytes limit'.format(
+                MAX_FRAME_SIZE + 1, MAX_FRAME_SIZE
+            ),
+        })
+        self.assertIsNone(recv_frame(sock))
+        sock.close()
+
+    def test_changes(self):
+        subscriber = DispatchClient(self.server.server_address)
+        changes = subscriber.changes()
+        self.client.add_hub('h1')
+        self.assertEqual(next(changes), ([('h1', 'h1')], []))
+        self.client.link('h1', 'n1')
+        self.assertEqual(next(changes), ([('h1', 'n1')], []))
+        self.client.unlink('h1', 'n1')
+        self.assertEqual(next(changes), ([], [('h1', 'n1')]))
+        subscriber.close()
+
+    def test_subscriber_disconnection(self):
+        subscriber = DispatchClient(self.server.server_address)
+        subscriber.changes()
+        writer = self.server.writer
+        self.assertEqual(len(writer._subscribers), 1)
+        subscriber.close()
+        deadline = time.time() + 5
+        while any(writer._subscribers) and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(writer._subscribers, set())
+
+    def test_concurrent_producers(self):
+        self.client.add_hub('h')
+        self.dispatch._max_nodes_per_hub = 1000
+
+        def produce(prefix):
+            client = DispatchClient(self.server.server_address)
+            for i in range(50):
+                client.link('h', '{}-{}'.format(prefix, i))
+            client.close()
+        producers = [
+            threading.Thread(target=produce, args=(p,)) for p in range(4)
+        ]
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+        self.assertEqual(self.dispatch._topology.hubs, {'h': 201})
+
+
+
+def writer_threads():
+    return len([
+        thread for thread in threading.enumerate()
+        if thread.name == 'hub-dispatch-writer'
+    ])
+
+class TestUnixServer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'dispatch.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def serve(self, server):
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            client = DispatchClient(self.path)
+            client.add_hub('h1').link('h1', 'n1')
+            client.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        return server.writer._dispatch
+
+    def test_unix_server(self):
+        dispatch = self.serve(UnixDispatchServer(self.path))
+        self.assertEqual(dispatch._topology.nodes, {'h1': 'h1', 'n1': 'h1'})
+
+    def test_create_server(self):
+        server = create_server([
+            '--unix', self.path,
+            '--max-nodes-per-hub', '1',
+            '--max-batch-size', '10',
+        ])
+        self.assertIsInstance(server, UnixDispatchServer)
+        self.assertEqual(server.writer._max_batch_size, 10)
+        with self.assertRaises(Exception) as exc:
+            self.serve(server)
+        self.assertEqual(exc.exception.message, 'NotImplementedError')
+
+    def test_restart(self):
+        self.serve(UnixDispatchServer(self.path))
+        self.assertFalse(os.path.exists(self.path))
+        self.serve(UnixDispatchServer(self.path))
+
+    def test_stale_socket(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.path)
+        stale.close()
+        self.serve(UnixDispatchServer(self.path))
+
+    def test_socket_in_use(self):
+        server = UnixDispatchServer(self.path)
+        writers = writer_threads()
+        with self.assertRaises(Exception) as exc:
+            UnixDispatchServer(self.path)
+        self.assertEqual(
+            exc.exception.message,
+            "Socket '{}' is already in use".format(self.path)
+        )
+        self.assertEqual(writer_threads(), writers)
+        self.assertTrue(os.path.exists(self.path))
+        server.server_close()
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TestDispatchWriter(unittest.TestCase):
+    def submit_while_stopped(self, writer, *hubs):
+        """ Submit one request per hub before the writer is started,
+        then wait for all of them to be processed.
+        """
+        producers = [
+            threading.Thread(target=writer.submit, args=('add_hub', [hub]))
+            for hub in hubs
+        ]
+        for producer in producers:
+            producer.start()
+        deadline = time.time() + 5
+        while writer._requests.qsize() < len(hubs) \
+                and time.time() < deadline:
+            time.sleep(0.01)
+        writer.start()
+        for producer in producers:
+            producer.join()
+        writer.stop()
+        writer.join()
+
+    def test_batch(self):
+        writer = DispatchWriter(HubDispatch())
+        changes = writer.subscribe()
+        self.submit_while_stopped(writer, 'h1', 'h2', 'h3')
+        self.assertEqual(changes.qsize(), 1)
+        self.assertEqual(
+            sorted(changes.get()['assignments']),
+            [('h1', 'h1'), ('h2', 'h2'), ('h3', 'h3')]
+        )
+
+    def test_max_batch_size(self):
+        writer = DispatchWriter(HubDispatch(), max_batch_size=2)
+        changes = writer.subscribe()
+        self.submit_while_stopped(writer, 'h1', 'h2', 'h3')
+        self.assertEqual(changes.qsize(), 2)
+        self.assertEqual(len(changes.get()['assignments']), 2)
+        self.assertEqual(len(changes.get()['assignments']), 1)
+
+    def test_publish_failure(self):
+        dispatch = HubDispatch()
+        pop_changes = dispatch.pop_changes
+
+        def failing_pop_changes():
+            dispatch.pop_changes = pop_changes
+            raise Exception('publish failure')
+        dispatch.pop_changes = failing_pop_changes
+        writer = DispatchWriter(dispatch)
+        writer.start()
+        # mutation was applied, only its notification is lost
+        self.assertIsNone(writer.submit('add_hub', ['h1']))
+        self.assertIsNone(writer.submit('add_hub', ['h2']))
+        self.assertEqual(dispatch._topology.nodes, {'h1': 'h1', 'h2': 'h2'})
+        writer.stop()
+        writer.join()
+
+    def test_slow_subscriber_is_dropped(self):
+        writer = DispatchWriter(HubDispatch(), max_pending_changes=1)
+        changes = writer.subscribe()
+        writer.start()
+        self.assertIsNone(writer.submit('add_hub', ['h1']))
+        self.assertTrue(writer.is_subscribed(changes))
+        self.assertIsNone(writer.submit('add_hub', ['h2']))
+        self.assertFalse(writer.is_subscribed(changes))
+        self.assertEqual(changes.qsize(), 1)
+        writer.stop()
+        writer.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
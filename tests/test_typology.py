@@ -194,6 +194,14 @@ class TestTopology(unittest.TestCase):
         self.assertEqual(h._changes.assignments, [('h2', 'n1')])
         self.assertEqual(h._changes.unassignments, [('h1', 'n1')])
 
+    def test_pop_changes(self):
+        h = HubDispatch().add_hub('h1').link('h1', 'n1').unlink('h1', 'n1')
+        self.assertEqual(h.pop_changes(), (
+            [('h1', 'h1'), ('h1', 'n1')],
+            [('h1', 'n1')],
+        ))
+        self.assertEqual(h.pop_changes(), ([], []))
+
     def test_least_loaded_func(self):
         h = HubDispatch()
         h._topology.hubs['foo'] = 0